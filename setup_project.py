@@ -1,294 +1,545 @@
 import argparse
+import asyncio
+import copy
+import functools
+import hashlib
+import json
 import logging
+import os
 import subprocess
 from pathlib import Path
 
-import requests
-import toml
-import yaml
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Downloaded template files are cached here and revalidated on later runs
+CACHE_DIR = Path.home() / ".cache" / "python-project-initializer"
+
+# Successfully fetched files by URL, so each one is requested once per process
+_fetched_files = {}
+
+DEFAULT_PRE_COMMIT_CONFIG_URL = "https://raw.githubusercontent.com/pre-commit/pre-commit-hooks/master/ci/pre-commit-config.yaml"
+DEFAULT_GITIGNORE_URL = (
+    "https://raw.githubusercontent.com/github/gitignore/master/Python.gitignore"
+)
+DEFAULT_LICENSE_URL = "https://github.com/git/git-scm.com/blob/main/MIT-LICENSE.txt"
+
+# The default templates ship with the script, so only URLs overridden in the
+# config have to be downloaded
+TEMPLATES_DIR = Path(__file__).resolve().parent / "templates"
+BUNDLED_TEMPLATES = {
+    DEFAULT_PRE_COMMIT_CONFIG_URL: "pre-commit-config.yaml",
+    DEFAULT_GITIGNORE_URL: "python.gitignore",
+    DEFAULT_LICENSE_URL: "MIT-LICENSE.txt",
+}
+
+# Stands in for `poetry init`, with the project details filled in by main
+PYPROJECT_TEMPLATE = """\
+[tool.poetry]
+name = "{name}"
+version = "{version}"
+description = ""
+authors = []
+readme = "README.md"
+
+[tool.poetry.dependencies]
+python = "^{python_version}"
+
+
+[build-system]
+requires = ["poetry-core"]
+build-backend = "poetry.core.masonry.api"
+"""
+
+# The static templates are kept encoded so they can be written out directly
+DOCKERFILE_TEMPLATE_BYTES = b"""\
+# Use an official Python runtime as a parent image
+FROM python:{python_version}-slim
+
+# Set the working directory in the container
+WORKDIR /usr/src/app
+
+# Copy the current directory contents into the container at /usr/src/app
+COPY . /usr/src/app
+
+# Install any needed packages specified in pyproject.toml
+RUN pip install poetry
+RUN poetry config virtualenvs.create false
+RUN poetry install
+
+# Make port 80 available to the world outside this container
+EXPOSE 80
+
+# Define environment variable
+ENV NAME World
+
+# Run app.py when the container launches
+CMD ["python", "your_script.py"]
+"""
+
+CI_CD_CONFIG_BYTES = b"""\
+name: Python application
+
+on: [push, pull_request]
+
+jobs:
+  build:
+    runs-on: ubuntu-latest
+    strategy:
+      matrix:
+        python-version: ["3.8", "3.9", "3.10", "3.11", "3.12"]
+
+    steps:
+      - uses: actions/checkout@v4
+      - name: Set up Python ${{ matrix.python-version }}
+        uses: actions/setup-python@v5
+        with:
+          python-version: ${{ matrix.python-version }}
+      - name: Install dependencies
+        run: |
+          pip install poetry
+          poetry install
+      - name: Test with pytest
+        run: |
+          poetry run pytest
+"""
 
-import logging
-import subprocess
 
+def write_file(path, data):
+    # Write the bytes with a single open/write/close, skipping the text layer
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+async def run_command(args, cwd, capture_output=False):
+    # Asynchronous counterpart of subprocess.run(args, check=True), so the event
+    # loop keeps running other stages while the command runs
+    pipe = asyncio.subprocess.PIPE if capture_output else None
+    process = await asyncio.create_subprocess_exec(
+        *args, cwd=str(cwd), stdout=pipe, stderr=pipe
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # Don't leave the command running unsupervised once the caller is gone
+        process.kill()
+        await process.wait()
+        raise
+    stdout = stdout.decode() if stdout is not None else None
+    stderr = stderr.decode() if stderr is not None else None
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, args, output=stdout, stderr=stderr
+        )
+    return stdout
 
-def setup_pyenv(base_path, python_version):
+
+async def setup_pyenv(base_path, python_version):
     # Ensure the specified Python version is installed using pyenv
     try:
         # Set the local Python version for the project
-        subprocess.check_output(["pyenv", "local", python_version], cwd=base_path)
-        logging.info(
-            f"Set up pyenv with Python {python_version} locally for the project"
+        await run_command(
+            ["pyenv", "local", python_version], cwd=base_path, capture_output=True
+        )
+        logger.info(
+            "Set up pyenv with Python %s locally for the project", python_version
         )
     except subprocess.CalledProcessError as e:
-        logging.error(f"Error with pyenv setup: {e.output.decode()}")
+        logger.error("Error with pyenv setup: %s", e.stderr)
 
 
-def set_poetry_environment(base_path):
+async def set_poetry_environment(base_path, python_version):
     try:
-        # Ensure this command is correctly obtaining the Python version from pyenv
-        pyenv_python_path = subprocess.check_output(
-            ["pyenv", "which", "python"], cwd=base_path, text=True
-        ).strip()
-        subprocess.run(
-            ["poetry", "env", "use", pyenv_python_path], cwd=base_path, check=True
+        # The interpreter of an installed version lives at a fixed place below
+        # the pyenv root, so only ask pyenv when it isn't there
+        pyenv_root = Path(os.environ.get("PYENV_ROOT", Path.home() / ".pyenv"))
+        pyenv_python_path = pyenv_root / "versions" / python_version / "bin" / "python"
+        if not pyenv_python_path.exists():
+            pyenv_python_path = (
+                await run_command(
+                    ["pyenv", "which", "python"], cwd=base_path, capture_output=True
+                )
+            ).strip()
+        await run_command(
+            ["poetry", "env", "use", str(pyenv_python_path)], cwd=base_path
         )
-        logging.info(f"Poetry environment set to use Python at: {pyenv_python_path}")
+        logger.info("Poetry environment set to use Python at: %s", pyenv_python_path)
     except subprocess.CalledProcessError as e:
-        logging.error(
-            f"Could not configure Poetry to use the pyenv Python version: {e}"
+        logger.error(
+            "Could not configure Poetry to use the pyenv Python version: %s", e
         )
 
 
-def create_project_structure(base_path, structure):
-    for item in structure:
+def compile_structure(structure):
+    # Structures that serialize the same compile to the same operations, so
+    # repeated runs with one config only walk it once
+    return _compile_structure(json.dumps(structure, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_structure(structure_json):
+    # Walk the structure once and flatten it into ("dir" | "file" | "init", path)
+    # operations relative to the project root. Strings are directories at the
+    # top level and files inside a folder's list, while dictionaries map
+    # folders to their contents.
+    dirs = []
+    files = []
+    stack = [(Path(), item, False) for item in reversed(json.loads(structure_json))]
+    while stack:
+        parent, item, is_file = stack.pop()
         if isinstance(item, str):
-            # Create a directory for string items
-            path = base_path / item
-            path.mkdir(parents=True, exist_ok=True)
-            logging.info(f"Created directory: {path}")
-            if "src" in path.parts:
-                # Create __init__.py in src and its subdirectories
-                (path / "__init__.py").touch()
-                logging.info(f"Created __init__.py in {path}")
+            dirs_or_files = files if is_file else dirs
+            dirs_or_files.append(parent / item)
         elif isinstance(item, dict):
             for folder, nested_items in item.items():
-                # Create a directory for each key in dictionary items
-                folder_path = base_path / folder
-                folder_path.mkdir(parents=True, exist_ok=True)
-                logging.info(f"Created directory: {folder_path}")
+                folder_path = parent / folder
+                dirs.append(folder_path)
                 if isinstance(nested_items, list):
-                    for nested_item in nested_items:
-                        if isinstance(nested_item, str):
-                            # Create a file if the nested item is a string
-                            file_path = folder_path / nested_item
-                            file_path.touch()
-                            logging.info(f"Created file: {file_path}")
-                        elif isinstance(nested_item, dict):
-                            # Recursively handle nested directories
-                            create_project_structure(folder_path, [nested_item])
-                if "src" in folder_path.parts:
-                    # Create __init__.py in src and its subdirectories
-                    (folder_path / "__init__.py").touch()
-                    logging.info(f"Created __init__.py in {folder_path}")
-
-
-def setup_git(base_path, remote_url=None):
-    subprocess.run(["git", "init"], cwd=base_path, check=True)
+                    stack.extend(
+                        (folder_path, nested_item, True)
+                        for nested_item in reversed(nested_items)
+                    )
+
+    # Only the deepest directories need an explicit mkdir, parents are implied.
+    # Each file and __init__.py in src and its subdirectories appears once.
+    unique_dirs = set(dirs)
+    parent_dirs = {parent for path in unique_dirs for parent in path.parents}
+    leaf_dirs = sorted(unique_dirs - parent_dirs)
+    inits = dict.fromkeys(
+        path / "__init__.py"
+        for path in sorted(unique_dirs, key=lambda path: path.parts)
+        if "src" in path.parts
+    )
+    return (
+        *(("dir", path) for path in leaf_dirs),
+        *(("file", path) for path in dict.fromkeys(files) if path not in inits),
+        *(("init", path) for path in inits),
+    )
+
+
+def create_project_structure(base_path, operations):
+    # Replay the operations from compile_structure as plain mkdir/create calls
+    dir_count = 0
+    for kind, path in operations:
+        if kind == "dir":
+            (base_path / path).mkdir(parents=True, exist_ok=True)
+            dir_count += 1
+        else:
+            open(base_path / path, "a").close()
+
+    # Listing every path is only worth the formatting cost when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        for kind, path in operations:
+            logger.debug("Created %s: %s", kind, base_path / path)
+    logger.info(
+        "Created %d leaf directories and %d files",
+        dir_count,
+        len(operations) - dir_count,
+    )
+
+
+async def setup_git(base_path, remote_url=None):
+    await run_command(["git", "init"], cwd=base_path)
     if remote_url:
-        subprocess.run(
-            ["git", "remote", "add", "origin", remote_url], cwd=base_path, check=True
-        )
-        initial_commit_and_push(base_path, remote_url)
+        await run_command(["git", "remote", "add", "origin", remote_url], cwd=base_path)
 
 
-def initial_commit_and_push(base_path, remote_url):
-    subprocess.run(["git", "add", "."], cwd=base_path, check=True, encoding="utf-8")
-    subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=base_path, check=True)
+async def initial_commit_and_push(base_path, remote_url):
+    await run_command(["git", "add", "."], cwd=base_path)
+    # Commit the scaffold as generated, without running the hooks that
+    # pre-commit has just installed
+    await run_command(
+        ["git", "commit", "--no-verify", "-m", "Initial commit"], cwd=base_path
+    )
     if remote_url:
-        subprocess.run(
-            ["git", "push", "-u", "origin", "master"], cwd=base_path, check=True
-        )
+        await run_command(["git", "push", "-u", "origin", "master"], cwd=base_path)
 
 
-def create_standard_files(base_path, gitignore_url, pre_commit_config_url, license_url):
-    # Combines fetching and creating both .gitignore, .pre-commit-config.yaml and README.md
+async def add_dependencies(base_path, dependencies):
+    error_log = []  # List to keep track of installation errors
+
+    # Group dependencies into batches so Poetry resolves the graph once per
+    # batch instead of once per dependency
+    batches = {}
+    for group, deps in dependencies.items():
+        for dep in deps or []:
+            dep_command = ["poetry", "add"]
 
-    def fetch_file(url):
+            # Check if the dependency is for development (-D) or main
+            if group != "main":
+                dep_command.append("-D")
+
+            # Special handling for torch or torchvision to use the custom source
+            if dep in ["torch", "torchvision"]:
+                dep_command.extend(["--source", "pytorch_cpu"])
+
+            batches.setdefault(tuple(dep_command), []).append(dep)
+
+    # The batches are run one after another since concurrent Poetry calls
+    # would race on pyproject.toml and poetry.lock
+    for dep_command, deps in batches.items():
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
-            logging.error(f"Failed to fetch file from {url}: {e}")
-            return None
-
-    gitignore_content = fetch_file(gitignore_url)
+            await run_command([*dep_command, *deps], cwd=base_path, capture_output=True)
+            continue
+        except subprocess.CalledProcessError:
+            # Poetry rolls back the whole batch if any dependency fails, so
+            # add them one by one to install the rest and find the culprit
+            logger.warning("Failed to add %s together, retrying one at a time", deps)
+
+        for dep in deps:
+            try:
+                await run_command(
+                    [*dep_command, dep], cwd=base_path, capture_output=True
+                )
+            except subprocess.CalledProcessError as e:
+                # Log the error for this dependency
+                error_message = (
+                    f"Failed to add dependency '{dep}' due to an error: {e.stderr}"
+                )
+                logger.error(error_message)
+                # Add the error message to the error_log list
+                error_log.append(error_message)
+
+    return error_log
+
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    # requests is only imported once a template actually has to be downloaded
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # One keep-alive session shared by all downloads, so requests to the same
+    # host reuse the connection instead of repeating the TLS handshake
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_file(url):
+    import requests
+
+    # Files fetched successfully earlier in this process are not requested again,
+    # while failures are retried on the next call
+    if url in _fetched_files:
+        return _fetched_files[url]
+
+    # Serve from the local cache when the server reports the file as unchanged
+    body_path = CACHE_DIR / hashlib.sha256(url.encode()).hexdigest()
+    etag_path = body_path.with_suffix(".etag")
+    last_modified_path = body_path.with_suffix(".last-modified")
+
+    headers = {}
+    if body_path.exists():
+        if etag_path.exists():
+            headers["If-None-Match"] = etag_path.read_text()
+        if last_modified_path.exists():
+            headers["If-Modified-Since"] = last_modified_path.read_text()
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=10)
+        if response.status_code == 304:
+            logger.info("Using cached copy of %s", url)
+            _fetched_files[url] = body_path.read_text(
+                encoding="utf-8", errors="replace"
+            )
+            return _fetched_files[url]
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if body_path.exists():
+            logger.warning("Failed to fetch %s, using cached copy: %s", url, e)
+            return body_path.read_text(encoding="utf-8", errors="replace")
+        logger.error("Failed to fetch file from %s: %s", url, e)
+        return None
+
+    # Most template hosts serve UTF-8, so try that before letting response.text
+    # guess the encoding. A charset sent by the server always wins.
+    if "charset" in response.headers.get("Content-Type", "").lower():
+        content = response.text
+    else:
+        try:
+            content = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            content = response.text
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        body_path.write_text(content, encoding="utf-8")
+        for path, header in (
+            (etag_path, "ETag"),
+            (last_modified_path, "Last-Modified"),
+        ):
+            if header in response.headers:
+                path.write_text(response.headers[header])
+            else:
+                path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning("Could not cache %s: %s", url, e)
+    _fetched_files[url] = content
+    return _fetched_files[url]
+
+
+def load_template(url):
+    if url in BUNDLED_TEMPLATES:
+        return (TEMPLATES_DIR / BUNDLED_TEMPLATES[url]).read_text(encoding="utf-8")
+    return fetch_file(url)
+
+
+async def create_standard_files(
+    base_path, gitignore_url, pre_commit_config_url, license_url
+):
+    # Combines fetching and creating both .gitignore, .pre-commit-config.yaml and README.md
+
+    # The downloads are independent, so run them concurrently in worker threads.
+    # The session is created up front so the threads don't race to build it.
+    urls = (gitignore_url, pre_commit_config_url, license_url)
+    if any(url not in BUNDLED_TEMPLATES for url in urls):
+        get_session()
+    loop = asyncio.get_running_loop()
+    gitignore_content, pre_commit_config_content, license_content = (
+        await asyncio.gather(
+            *(loop.run_in_executor(None, load_template, url) for url in urls)
+        )
+    )
+
     if gitignore_content:
-        (base_path / ".gitignore").write_text(gitignore_content)
-        logging.info("Created .gitignore")
+        write_file(base_path / ".gitignore", gitignore_content.encode())
+        logger.info("Created .gitignore")
 
-    pre_commit_config_content = fetch_file(pre_commit_config_url)
     if pre_commit_config_content:
         pre_commit_config_path = base_path / ".pre-commit-config.yaml"
-        pre_commit_config_path.write_text(pre_commit_config_content)
-        logging.info("Downloaded and created .pre-commit-config.yaml")
-        subprocess.run(["pre-commit", "install"], cwd=base_path, check=True)
-        logging.info("Set up pre-commit hooks")
+        write_file(pre_commit_config_path, pre_commit_config_content.encode())
+        logger.info("Created .pre-commit-config.yaml")
+        await run_command(["pre-commit", "install"], cwd=base_path)
+        logger.info("Set up pre-commit hooks")
 
-    license_content = fetch_file(license_url)
     if license_content:
-        (base_path / "LICENSE").write_text(license_content)
-        logging.info("Created LICENSE file")
+        write_file(base_path / "LICENSE", license_content.encode())
+        logger.info("Created LICENSE file")
 
     # Create README.md as before
-    (base_path / "README.md").write_text(f"# Project {base_path.name}\n")
-
-
-def update_pyproject(base_path, config):
-    pyproject_path = base_path / "pyproject.toml"
-    pyproject = toml.load(pyproject_path)
-    pyproject["tool"]["poetry"]["name"] = config["project_name"]
-    pyproject["tool"]["poetry"]["version"] = config.get("version", "0.1.0")
-    pyproject["tool"]["poetry"]["readme"] = "README.md"
-    pyproject["tool"]["poetry"]["dependencies"]["python"] = "^" + config.get(
-        "python_version"
-    )
-    pyproject["tool"]["poetry"]["authors"] = []
-    toml.dump(pyproject, pyproject_path.open("w"))
+    write_file(base_path / "README.md", f"# Project {base_path.name}\n".encode())
 
 
 def create_dockerfile(base_path, python_version):
-    dockerfile_content = f"""
-    # Use an official Python runtime as a parent image
-    FROM python:{python_version}-slim
+    dockerfile_content = DOCKERFILE_TEMPLATE_BYTES.replace(
+        b"{python_version}", python_version.encode()
+    )
+    write_file(base_path / "Dockerfile", dockerfile_content)
+    logger.info("Created Dockerfile")
 
-    # Set the working directory in the container
-    WORKDIR /usr/src/app
 
-    # Copy the current directory contents into the container at /usr/src/app
-    COPY . /usr/src/app
+def setup_testing_and_ci_cd(base_path):
+    workflows_path = base_path / ".github" / "workflows"
+    workflows_path.mkdir(parents=True, exist_ok=True)
+    write_file(workflows_path / "python-app.yml", CI_CD_CONFIG_BYTES)
+    logger.info("Created CI/CD configuration")
 
-    # Install any needed packages specified in pyproject.toml
-    RUN pip install poetry
-    RUN poetry config virtualenvs.create false
-    RUN poetry install
 
-    # Make port 80 available to the world outside this container
-    EXPOSE 80
+@functools.lru_cache(maxsize=32)
+def _load_config(config_path, mtime_ns):
+    import yaml
 
-    # Define environment variable
-    ENV NAME World
+    try:
+        # Prefer the libyaml bindings when PyYAML was built with them
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
 
-    # Run app.py when the container launches
-    CMD ["python", "your_script.py"]
-    """
-    (base_path / "Dockerfile").write_text(dockerfile_content.strip())
-    logging.info("Created Dockerfile")
+    with open(config_path, "r") as file:
+        return yaml.load(file, Loader=SafeLoader)
 
 
-def setup_testing_and_ci_cd(base_path):
-    ci_cd_config = """
-    name: Python application
-
-    on: [push, pull_request]
-
-    jobs:
-    build:
-        runs-on: ubuntu-latest
-        strategy:
-        matrix:
-            python-version: [3.6, 3.7, 3.8, 3.9, 3.10]
-
-        steps:
-        - uses: actions/checkout@v2
-        - name: Set up Python ${{ matrix.python-version }}
-        uses: actions/setup-python@v2
-        with:
-            python-version: ${{ matrix.python-version }}
-        - name: Install dependencies
-        run: |
-            pip install poetry
-            poetry install
-        - name: Test with pytest
-        run: |
-            poetry run pytest
-    """
-    (base_path / ".github" / "workflows" / "python-app.yml").mkdir(
-        parents=True, exist_ok=True
-    )
-    (base_path / ".github" / "workflows" / "python-app.yml" / "ci-cd.yaml").write_text(
-        ci_cd_config.strip()
+def load_config(config_path):
+    # The modification time is part of the cache key, so an edited config file
+    # is parsed again while an unchanged one is served from memory. Callers get
+    # their own copy, so changing it can't leak into later calls.
+    return copy.deepcopy(
+        _load_config(str(config_path), os.stat(config_path).st_mtime_ns)
     )
-    logging.info("Created CI/CD configuration")
 
 
-def main(config_path):
-    with open(config_path, "r") as file:
-        config = yaml.safe_load(file)
+async def main(config_path):
+    config = load_config(config_path)
 
     project_name = config["project_name"]
     dependencies = config["dependencies"]
-    structure = config.get("structure", [])
+    # Turn the structure into a flat list of operations before touching disk
+    structure_operations = compile_structure(config.get("structure", []))
     remote_url = config.get("remote_url", None)
     python_version = config.get("python_version", "3.8")
     pre_commit_config_url = config.get(
-        "pre_commit_config_url",
-        "https://raw.githubusercontent.com/pre-commit/pre-commit-hooks/master/ci/pre-commit-config.yaml",
-    )
-    gitignore_url = config.get(
-        "gitignore_url",
-        "https://raw.githubusercontent.com/github/gitignore/master/Python.gitignore",
-    )
-    license_url = config.get(
-        "license_url",
-        "https://github.com/git/git-scm.com/blob/main/MIT-LICENSE.txt",
+        "pre_commit_config_url", DEFAULT_PRE_COMMIT_CONFIG_URL
     )
+    gitignore_url = config.get("gitignore_url", DEFAULT_GITIGNORE_URL)
+    license_url = config.get("license_url", DEFAULT_LICENSE_URL)
 
     base_path = Path("..").resolve() / project_name
 
     base_path.mkdir(parents=True, exist_ok=True)
-    create_project_structure(base_path, structure)
-    setup_pyenv(base_path, python_version)
-
-    subprocess.run(
-        ["poetry", "init", "--no-interaction", "--name", project_name],
-        cwd=str(base_path),
-        check=True,
+    create_project_structure(base_path, structure_operations)
+
+    write_file(
+        base_path / "pyproject.toml",
+        PYPROJECT_TEMPLATE.format(
+            name=project_name,
+            version=config.get("version", "0.1.0"),
+            python_version=python_version,
+        ).encode(),
     )
-
-    set_poetry_environment(base_path)
-    update_pyproject(base_path, config)
-
-    error_log = []  # List to keep track of installation errors
-
-    if dependencies is not None:
-        for group, deps in dependencies.items():
-            for dep in deps:
-                try:
-                    dep_command = ["poetry", "add"]
-
-                    # Check if the dependency is for development (-D) or main
-                    if group != "main":
-                        dep_command.append("-D")
-
-                    # Special handling for torch or torchvision to use the custom source
-                    if dep in ["torch", "torchvision"]:
-                        dep_command.extend(["--source", "pytorch_cpu", dep])
-                    else:
-                        dep_command.append(dep)
-
-                    subprocess.run(
-                        dep_command,
-                        cwd=str(base_path),
-                        check=True,
-                        capture_output=True,
-                        text=True,
-                    )
-                except subprocess.CalledProcessError as e:
-                    # Log the error for this dependency
-                    error_message = (
-                        f"Failed to add dependency '{dep}' due to an error: {e.stderr}"
-                    )
-                    logging.error(error_message)
-                    # Add the error message to the error_log list
-                    error_log.append(error_message)
-
     create_dockerfile(base_path, python_version)
+    setup_testing_and_ci_cd(base_path)
 
-    setup_git(base_path, remote_url)
+    # The repository has to exist before pre-commit can install its hooks
+    await setup_git(base_path, remote_url)
+
+    # pyenv local writes .python-version, which decides the interpreter that
+    # shims such as pre-commit resolve, so it has to be in place before either
+    # of the concurrent branches starts
+    await setup_pyenv(base_path, python_version)
+
+    async def setup_python_environment():
+        await set_poetry_environment(base_path, python_version)
+        if dependencies is None:
+            return []
+        return await add_dependencies(base_path, dependencies)
+
+    # Poetry and the template downloads don't depend on each other. Both are
+    # allowed to finish before a failure in either one is raised, so Poetry is
+    # never left writing to the project after the script has exited.
+    error_log, standard_files_result = await asyncio.gather(
+        setup_python_environment(),
+        create_standard_files(
+            base_path, gitignore_url, pre_commit_config_url, license_url
+        ),
+        return_exceptions=True,
+    )
+    for result in (error_log, standard_files_result):
+        if isinstance(result, BaseException):
+            raise result
 
-    create_standard_files(base_path, gitignore_url, pre_commit_config_url, license_url)
-    setup_testing_and_ci_cd(base_path)
+    if remote_url:
+        await initial_commit_and_push(base_path, remote_url)
 
     if error_log:
-        logging.error("There were errors installing some dependencies:")
+        logger.error("There were errors installing some dependencies:")
         for error in error_log:
-            logging.error(error)
+            logger.error(error)
 
-    logging.info(f"Project {project_name} set up at {base_path}")
+    logger.info("Project %s set up at %s", project_name, base_path)
 
 
 if __name__ == "__main__":
@@ -296,4 +547,4 @@ if __name__ == "__main__":
     parser.add_argument("config", help="Path to the project configuration YAML file")
     args = parser.parse_args()
 
-    main(args.config)
+    asyncio.run(main(args.config))